@@ -1,15 +1,51 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from itertools import chain
-from typing import Union, List
+from typing import Union, List, Tuple
+import threading
 import warnings
-import pickle
+import platform
 import os
 import re
 
 import pandas as pd
 import numpy as np
-from sentence_transformers import SentenceTransformer, util
+from sentence_transformers import SentenceTransformer
+import onnxruntime
 import torch
 
+# Bytes of the (sentences x entities) similarity matrix that is materialized at once on accelerators,
+# enough for typical requests to be matched against all the entities with a single GEMM
+_SIMILARITY_BLOCK_BYTES = 64 * 1024 * 1024
+
+# Bytes of (widened) entity embeddings that are compared against the sentences at once on CPU,
+# small enough for the block to stay in the L2 cache while every sentence goes over it
+_ENTITY_BLOCK_BYTES = 384 * 1024
+
+# Number of entity descriptions that are encoded before being written to the cache file
+_CORPUS_CHUNK_SIZE = 1024
+
+# Runs of the separators the texts are split into sentences at
+_SENTENCE_SEPARATORS = re.compile(r"(?:[\r\n\t.,;]|and|or)+")
+
+# Number of recently seen sentences whose embeddings are kept
+_SENTENCE_CACHE_SIZE = 10000
+
+# The supported precisions and the dtypes the entity embeddings are kept in
+_PRECISIONS = {
+    "fp32": torch.float32,
+    "fp16": torch.float16,
+    "bf16": torch.bfloat16,
+    "int8": torch.int8,
+}
+
+# The loaded entities and their embeddings, shared by the extractors of the process with the same device and precision
+_ENTITIES = {}
+_ENTITIES_LOCK = threading.Lock()
+
+# The models inherited from the parent process through fork(), kept referenced so they are never destroyed in the child
+_INHERITED_MODELS = []
+
 
 class SkillExtractor:
     def __init__(
@@ -17,6 +53,7 @@ class SkillExtractor:
         skills_threshold: float = 0.45,
         occupation_threshold: float = 0.55,
         device: Union[str, None] = None,
+        precision: str = "auto",
     ):
         """
         Loads the model, skills and skill embeddings.
@@ -25,6 +62,7 @@ class SkillExtractor:
             skills_threshold (float, optional): The similarity threshold for skill comparisons. Increase it to be more harsh. Defaults to 0.45. Range: [0, 1].
             occupation_threshold (float, optional): The similarity threshold for occupation comparisons. Increase it to be more harsh. Defaults to 0.55. Range: [0, 1].
             device (Union[str, None], optional): The device where the model will run. Defaults to "cuda" if available, otherwise "cpu".
+            precision (str, optional): The precision of the model and the embeddings, one of "fp32", "fp16", "bf16" or "int8" (CPU only). Defaults to "auto", which is int8 on CPU and bf16 (fp16 with TensorRT or on older GPUs) on accelerators.
         """
 
         self.skills_threshold = skills_threshold
@@ -32,86 +70,406 @@ class SkillExtractor:
         self.device = (
             device if device else "cuda" if torch.cuda.is_available() else "cpu"
         )
+        self.precision = self._resolve_precision(precision)
         self._dir = __file__.replace("__init__.py", "")
+        self._sentence_cache = OrderedDict()
+        self._sentence_cache_lock = threading.Lock()
         self._load_models()
-        self._load_skills()
-        self._load_occupations()
-        self._create_skill_embeddings()
-        self._create_occupation_embeddings()
+        self._load_entities()
+
+    def _resolve_precision(self, precision: str) -> str:
+        """
+        This method resolves the precision to run at on the device.
+
+        Args:
+            precision (str): The requested precision, or "auto".
+
+        Returns:
+            str: The precision to run at.
+
+        Raises:
+            ValueError: If the precision is unknown or not supported on the device.
+        """
+
+        if precision == "auto":
+            if self.device == "cpu":
+                return "int8"
+            if self.device.startswith("cuda") and not self._tensorrt_available():
+                return "bf16" if torch.cuda.is_bf16_supported() else "fp16"
+            return "fp16"
+
+        if precision not in _PRECISIONS:
+            raise ValueError(
+                f"Unknown precision {precision!r}, expected one of {list(_PRECISIONS)} or 'auto'."
+            )
+        if precision == "int8" and self.device != "cpu":
+            raise ValueError("The int8 precision is only supported on CPU.")
+        if precision == "fp16" and self.device == "cpu":
+            raise ValueError(
+                "The fp16 precision is not supported on CPU, use bf16 instead."
+            )
+
+        return precision
+
+    def _tensorrt_available(self) -> bool:
+        """
+        This method checks whether the model can run as a TensorRT engine on the device.
+
+        Returns:
+            bool: True if the device is a CUDA device and ONNX Runtime has the TensorRT provider.
+        """
+
+        return (
+            self.device.startswith("cuda")
+            and "TensorrtExecutionProvider" in onnxruntime.get_available_providers()
+        )
+
+    def _avx512_vnni_available(self) -> bool:
+        """
+        This method checks whether the CPU has the AVX-512 VNNI instructions, from the flags the Linux kernel reports.
+
+        Returns:
+            bool: True if the CPU reports avx512_vnni, False otherwise or if the flags cannot be read.
+        """
+
+        try:
+            with open("/proc/cpuinfo", encoding="utf-8") as f:
+                return any(
+                    line.startswith("flags") and "avx512_vnni" in line.split()
+                    for line in f
+                )
+        except OSError:
+            return False
 
     def _load_models(self):
         """
         This method loads the model from the SentenceTransformer library.
+        On CPU the ONNX Runtime backend is used at int8 and fp32. At int8 it runs a dynamically quantized export of the model,
+        so the transformer MatMuls run on the int8 dot-product instructions of the CPU. The AVX-512 VNNI export is only used on CPUs
+        that have VNNI, as its signed int8 weights saturate the AVX2 instructions, the other x86 CPUs run the unsigned AVX2 export.
+        At fp32 it runs the O3 optimized export, whose attention, GELU and LayerNorm subgraphs are fused into single kernels.
+        The CPU sessions use as many intra-op threads as torch, so forked workers keep to their share of the cores.
+        At fp16 or fp32 on CUDA the model runs as a TensorRT engine through ONNX Runtime when the TensorRT provider is available.
+        Otherwise it runs on PyTorch, with its weights cast to the precision.
         """
 
+        if self.device == "cpu" and self.precision in ("int8", "fp32"):
+            # The model repository ships pre-quantized exports for the common CPU architectures and graph optimized ones
+            if self.precision == "fp32":
+                onnx_file = "onnx/model_O3.onnx"
+            elif platform.machine().lower() in ("arm64", "aarch64"):
+                onnx_file = "onnx/model_qint8_arm64.onnx"
+            elif self._avx512_vnni_available():
+                onnx_file = "onnx/model_qint8_avx512_vnni.onnx"
+            else:
+                onnx_file = "onnx/model_quint8_avx2.onnx"
+
+            session_options = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = torch.get_num_threads()
+            session_options.inter_op_num_threads = 1
+            backend_kwargs = {
+                "backend": "onnx",
+                "model_kwargs": {
+                    "file_name": onnx_file,
+                    "session_options": session_options,
+                },
+            }
+        elif self.precision in ("fp16", "fp32") and self._tensorrt_available():
+            # The engine is built on the first run for the given shape range and cached next to the data
+            engine_cache_path = f"{self._dir}/data/tensorrt/{self.precision}"
+            os.makedirs(engine_cache_path, exist_ok=True)
+            shapes = "input_ids:{0},attention_mask:{0},token_type_ids:{0}"
+            backend_kwargs = {
+                "backend": "onnx",
+                "model_kwargs": {
+                    "file_name": "onnx/model.onnx",
+                    "provider": "TensorrtExecutionProvider",
+                    "provider_options": {
+                        "device_id": torch.device(self.device).index or 0,
+                        "trt_fp16_enable": self.precision == "fp16",
+                        "trt_engine_cache_enable": True,
+                        "trt_engine_cache_path": engine_cache_path,
+                        "trt_profile_min_shapes": shapes.format("1x1"),
+                        "trt_profile_opt_shapes": shapes.format("64x128"),
+                        "trt_profile_max_shapes": shapes.format("256x256"),
+                    },
+                },
+            }
+        else:
+            backend_kwargs = {}
+
         # Ignore the security warning messages about loading the model from pickle
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
-            self._model = SentenceTransformer("all-MiniLM-L6-v2", device=self.device)
+            self._model = SentenceTransformer(
+                "all-MiniLM-L6-v2", device=self.device, **backend_kwargs
+            )
+
+        self._backend = backend_kwargs.get("backend", "torch")
+        if self._backend == "torch":
+            self._model.to(_PRECISIONS[self.precision])
+
+        # The PyTorch model on CUDA uploads its inputs on a dedicated stream, overlapping the copies with the compute
+        self._copy_stream = (
+            torch.cuda.Stream(device=self.device)
+            if self._backend == "torch" and self.device.startswith("cuda")
+            else None
+        )
+
+    def _after_fork(self):
+        """
+        This method prepares the extractor for use in a forked process.
+        ONNX Runtime sessions own thread pools that do not survive fork(), so the ONNX model is loaded again.
+        The inherited session is kept referenced and never used, as destroying it would join threads that do not exist in the child.
+        The PyTorch model is kept as is, so its weights stay shared with the parent process copy-on-write like the embeddings,
+        instead of every process holding a copy of its own. Its forward pass runs on torch's OpenMP thread pool,
+        which does not survive fork() either, so the parent must not have run torch with more than one thread before forking.
+        """
+
+        if self._backend != "torch":
+            _INHERITED_MODELS.append(self._model)
+            self._load_models()
+
+    def _load_entities(self):
+        """
+        This method loads the skills and occupations with their embeddings, once per process for each device and precision.
+        Further extractors (e.g. with other thresholds) reuse the resident embeddings instead of loading, moving and quantizing them again.
+        """
+
+        key = (self.device, self.precision)
+
+        with _ENTITIES_LOCK:
+            if key not in _ENTITIES:
+                self._load_skills()
+                self._load_occupations()
+                self._create_embeddings()
+                self._quantize_entity_embeddings()
+                _ENTITIES[key] = {
+                    name: getattr(self, name)
+                    for name in (
+                        "_skills",
+                        "_skill_ids",
+                        "_skill_embeddings",
+                        "_skill_scales",
+                        "_occupations",
+                        "_occupation_ids",
+                        "_occupation_embeddings",
+                        "_occupation_scales",
+                    )
+                }
+
+            vars(self).update(_ENTITIES[key])
 
     def _load_skills(self):
         """
         This method loads the skills from the skills.csv file.
+        The IDs are kept as a fixed-width bytes array, so gathering them is a contiguous copy.
         """
 
-        self._skills = pd.read_csv(f"{self._dir}/data/skills.csv")
-        self._skill_ids = self._skills["id"].to_numpy()
+        self._skills = pd.read_csv(
+            f"{self._dir}/data/skills.csv", usecols=["id", "description"], dtype=str
+        )
+        self._skill_ids = self._skills["id"].to_numpy(dtype=bytes)
 
     def _load_occupations(self):
         """
         This method loads the occupations from the occupations.csv file.
+        The IDs are kept as a fixed-width bytes array, so gathering them is a contiguous copy.
         """
 
-        self._occupations = pd.read_csv(f"{self._dir}/data/occupations.csv")
-        self._occupation_ids = self._occupations["id"].to_numpy()
+        self._occupations = pd.read_csv(
+            f"{self._dir}/data/occupations.csv",
+            usecols=["id", "description"],
+            dtype=str,
+        )
+        self._occupation_ids = self._occupations["id"].to_numpy(dtype=bytes)
 
-    def _create_skill_embeddings(self):
+    def _encode_corpus(self, texts: List[str], path: str):
         """
-        This method creates the skill embeddings and saves them to a cache file.
-        If the cache file exists, it loads the embeddings from it.
+        This method encodes the descriptions of the entities and streams their embeddings into a float16 .npy file.
+        The texts are encoded in chunks, so only one chunk of float32 embeddings is held in memory at a time.
+        They are sorted by length across the whole corpus first, so each batch is only padded to its own longest text.
+        The file is written under a temporary name and moved in place once complete, so an interrupted run leaves no partial cache.
+        The corpus is always encoded with the fp32 PyTorch model, so the cache file is the same whichever backend and precision created it.
+
+        Args:
+            texts (List[str]): The descriptions to encode.
+            path (str): The path of the .npy file to write the normalized embeddings to.
         """
 
-        if os.path.exists(f"{self._dir}/data/skill_embeddings.bin"):
-            with open(f"{self._dir}/data/skill_embeddings.bin", "rb") as f:
-                self._skill_embeddings = pickle.load(f).to(self.device)
+        if self._backend == "torch" and self.precision == "fp32":
+            model = self._model
         else:
-            print(
-                "Skill embeddings file not found. Creating embeddings from scratch..."
-            )
-            self._skill_embeddings = self._model.encode(
-                self._skills["description"].to_list(),
+            # Ignore the security warning messages about loading the model from pickle
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                model = SentenceTransformer("all-MiniLM-L6-v2", device=self.device)
+
+        order = np.argsort([len(text) for text in texts], kind="stable")
+        embeddings = np.lib.format.open_memmap(
+            f"{path}.tmp",
+            mode="w+",
+            dtype=np.float16,
+            shape=(len(texts), model.get_sentence_embedding_dimension()),
+        )
+
+        for start in range(0, len(texts), _CORPUS_CHUNK_SIZE):
+            indices = order[start : start + _CORPUS_CHUNK_SIZE]
+            embeddings[indices] = model.encode(
+                [texts[i] for i in indices],
+                batch_size=256,
                 device=self.device,
+                show_progress_bar=False,
                 normalize_embeddings=True,
-                convert_to_tensor=True,
+                convert_to_numpy=True,
             )
-            with open(f"{self._dir}/data/skill_embeddings.bin", "wb") as f:
-                pickle.dump(self._skill_embeddings, f)
 
-    def _create_occupation_embeddings(self):
+        embeddings.flush()
+        del embeddings
+        os.replace(f"{path}.tmp", path)
+
+    @torch.inference_mode()
+    def _create_embeddings(self):
         """
-        This method creates the occupations embeddings and saves them to a cache file.
-        If the cache file exists, it loads the embeddings from it.
+        This method creates the skill and occupation embeddings in a single encoding pass and saves them to a cache file.
+        The cache file holds a single contiguous float16 matrix of the fp32 model's embeddings, named after that precision,
+        so caches written by the quantized or reduced precision models of earlier versions are not picked up.
+        If the cache file exists and matches the loaded entities and the model, it loads the embeddings from it.
         """
 
-        if os.path.exists(f"{self._dir}/data/occupation_embeddings.bin"):
-            with open(f"{self._dir}/data/occupation_embeddings.bin", "rb") as f:
-                self._occupation_embeddings = pickle.load(f).to(self.device)
-        else:
-            print(
-                "Occupation embeddings file not found. Creating embeddings from scratch..."
+        path = f"{self._dir}/data/corpus_embeddings_fp32.npy"
+        sizes = [len(self._skills), len(self._occupations)]
+        shape = (sum(sizes), self._model.get_sentence_embedding_dimension())
+        embeddings = None
+
+        if os.path.exists(path):
+            # Map the cache file copy-on-write, so no extra copy is made on CPU
+            embeddings = np.load(path, mmap_mode="c")
+
+        if embeddings is None or embeddings.shape != shape:
+            print("Embeddings file not found. Creating embeddings from scratch...")
+            self._encode_corpus(
+                self._skills["description"].to_list()
+                + self._occupations["description"].to_list(),
+                path,
             )
-            self._occupation_embeddings = self._model.encode(
-                self._occupations["description"].to_list(),
-                device=self.device,
-                normalize_embeddings=True,
-                convert_to_tensor=True,
+            embeddings = np.load(path, mmap_mode="c")
+
+        # The skills come first in the cache file, followed by the occupations
+        self._skill_embeddings, self._occupation_embeddings = (
+            e.to(self.device) for e in torch.split(torch.from_numpy(embeddings), sizes)
+        )
+
+    @torch.inference_mode()
+    def _quantize_entity_embeddings(self):
+        """
+        This method quantizes the skill and occupation embeddings to int8 with a per-row scale at the int8 precision.
+        The similarity kernel streams 4x fewer bytes of the entity matrices this way.
+        At the other precisions the embeddings are cast to the dtype of the precision instead, so on CUDA the similarity GEMM runs on the Tensor Cores at fp16 and bf16.
+        The scales are set to None when the embeddings are not quantized.
+        """
+
+        self._skill_scales = None
+        self._occupation_scales = None
+
+        if self.precision != "int8":
+            dtype = _PRECISIONS[self.precision]
+            self._skill_embeddings = self._skill_embeddings.to(dtype).contiguous()
+            self._occupation_embeddings = self._occupation_embeddings.to(
+                dtype
+            ).contiguous()
+            return
+
+        def quantize(embeddings: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+            embeddings = embeddings.float()
+            scales = embeddings.abs().amax(dim=-1).clamp(min=1e-12) / 127
+            quantized = torch.round(embeddings / scales.unsqueeze(-1)).to(torch.int8)
+            return quantized.contiguous(), scales
+
+        self._skill_embeddings, self._skill_scales = quantize(self._skill_embeddings)
+        self._occupation_embeddings, self._occupation_scales = quantize(
+            self._occupation_embeddings
+        )
+
+    def _max_similarity(
+        self,
+        sentence_embeddings: torch.Tensor,
+        entity_embeddings: torch.Tensor,
+        entity_scales: Union[torch.Tensor, None],
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        This method finds the most similar entity for each sentence.
+        The entities are processed in blocks keeping only a running maximum, so the full
+        (sentences x entities) similarity matrix is never materialized.
+        On CPU the blocks are sized to fit in the L2 cache, so the entity matrix is streamed from memory once per call.
+        On accelerators the blocks are sized by a memory budget, so most requests take a single GEMM and reduction.
+
+        Args:
+            sentence_embeddings (torch.Tensor): The normalized embeddings of the sentences.
+            entity_embeddings (torch.Tensor): The normalized (and possibly int8 quantized) embeddings of the entities.
+            entity_scales (Union[torch.Tensor, None]): The per-entity scales of the quantized embeddings, None if they are not quantized.
+
+        Returns:
+            Tuple[torch.Tensor, torch.Tensor]: The score and the index of the most similar entity for each sentence.
+        """
+
+        # Quantized entities are widened to float32, otherwise the sentences follow the entities' precision
+        sentence_embeddings = sentence_embeddings.to(
+            torch.float32 if entity_scales is not None else entity_embeddings.dtype
+        )
+
+        if sentence_embeddings.device.type == "cpu":
+            block_size = max(
+                1,
+                _ENTITY_BLOCK_BYTES
+                // (entity_embeddings.shape[-1] * sentence_embeddings.element_size()),
+            )
+        else:
+            block_size = max(
+                1,
+                _SIMILARITY_BLOCK_BYTES
+                // (
+                    max(1, len(sentence_embeddings))
+                    * sentence_embeddings.element_size()
+                ),
             )
-            with open(f"{self._dir}/data/occupation_embeddings.bin", "wb") as f:
-                pickle.dump(self._occupation_embeddings, f)
+
+        if block_size >= len(entity_embeddings) and entity_scales is None:
+            # The embeddings are normalized so the dot product is the cosine similarity
+            return torch.max(sentence_embeddings @ entity_embeddings.T, dim=-1)
+
+        scores = torch.full(
+            (len(sentence_embeddings),),
+            -torch.inf,
+            dtype=sentence_embeddings.dtype,
+            device=sentence_embeddings.device,
+        )
+        indices = torch.zeros(
+            len(sentence_embeddings),
+            dtype=torch.long,
+            device=sentence_embeddings.device,
+        )
+
+        for start in range(0, len(entity_embeddings), block_size):
+            end = start + block_size
+            block = entity_embeddings[start:end].to(sentence_embeddings.dtype)
+
+            # The embeddings are normalized so the dot product is the cosine similarity
+            similarity = sentence_embeddings @ block.T
+            if entity_scales is not None:
+                similarity *= entity_scales[start:end]
+
+            block_scores, block_indices = torch.max(similarity, dim=-1)
+            better = block_scores > scores
+            scores = torch.where(better, block_scores, scores)
+            indices = torch.where(better, block_indices + start, indices)
+
+        return scores, indices
 
     def _text_to_sentences(self, text: str) -> List[str]:
         """
         This method splits the text into sentences.
+        The sentences are stripped and the blank ones are dropped, since they carry nothing to encode.
 
         Args:
             text (str): The text to split into sentences.
@@ -120,84 +478,250 @@ class SkillExtractor:
             List[str]: A list of sentences.
         """
 
-        return [s for s in re.split(r"\r|\n|\t|\.|\,|\;|and|or", text.strip()) if s]
+        return [
+            sentence
+            for s in _SENTENCE_SEPARATORS.split(text)
+            if (sentence := s.strip())
+        ]
 
-    def _get_entity(
+    def _encode_sentences(self, sentences: List[str]) -> torch.Tensor:
+        """
+        This method encodes the sentences, reusing the embeddings of recently seen sentences.
+        Short sentences such as "Python" or "project management" repeat a lot across texts,
+        so once they are cached they skip the transformer entirely.
+
+        Args:
+            sentences (List[str]): The sentences to encode.
+
+        Returns:
+            torch.Tensor: The normalized embeddings of the sentences.
+        """
+
+        if not sentences:
+            return torch.empty(
+                (0, self._model.get_sentence_embedding_dimension()), device=self.device
+            )
+
+        embeddings = {}
+        with self._sentence_cache_lock:
+            for sentence in sentences:
+                if sentence not in embeddings and sentence in self._sentence_cache:
+                    self._sentence_cache.move_to_end(sentence)
+                    embeddings[sentence] = self._sentence_cache[sentence]
+
+        missing = [s for s in dict.fromkeys(sentences) if s not in embeddings]
+
+        if missing:
+            missing_embeddings = self._encode_batches(missing, batch_size=64)
+            embeddings.update(zip(missing, missing_embeddings))
+
+            # The rows are copied, so the cache does not keep the whole batch alive
+            with self._sentence_cache_lock:
+                for sentence, embedding in zip(missing, missing_embeddings):
+                    self._sentence_cache[sentence] = embedding.clone()
+                while len(self._sentence_cache) > _SENTENCE_CACHE_SIZE:
+                    self._sentence_cache.popitem(last=False)
+
+        return torch.stack([embeddings[sentence] for sentence in sentences])
+
+    def _encode_batches(self, sentences: List[str], batch_size: int) -> torch.Tensor:
+        """
+        This method encodes the sentences like SentenceTransformer.encode, but with the stages of consecutive batches overlapped.
+        The batches are tokenized ahead in a worker thread, which runs in parallel since the Rust tokenizer releases the GIL,
+        while the model runs on the current batch.
+        With the PyTorch model on CUDA, the tokens of each batch are also staged in pinned memory and uploaded on the copy stream,
+        so the upload of the next batch overlaps with the forward pass of the current one on the compute stream.
+
+        Args:
+            sentences (List[str]): The sentences to encode.
+            batch_size (int): The number of sentences encoded at once.
+
+        Returns:
+            torch.Tensor: The normalized embeddings of the sentences.
+        """
+
+        # Sort by length as SentenceTransformer.encode does, so each batch is padded only to its own longest sentence
+        order = np.argsort([-len(sentence) for sentence in sentences], kind="stable")
+        batches = [
+            [sentences[i] for i in order[start : start + batch_size]]
+            for start in range(0, len(sentences), batch_size)
+        ]
+
+        def upload(features: dict) -> dict:
+            features = {
+                name: value
+                for name, value in features.items()
+                if isinstance(value, torch.Tensor)
+            }
+            if self._copy_stream is None:
+                return {name: value.to(self.device) for name, value in features.items()}
+
+            with torch.cuda.stream(self._copy_stream):
+                return {
+                    name: value.pin_memory().to(self.device, non_blocking=True)
+                    for name, value in features.items()
+                }
+
+        outputs = []
+
+        # The pool is created per call, since its thread would not survive fork(). A single batch has nothing to overlap.
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            tokenized = (pool.map if len(batches) > 1 else map)(
+                self._model.tokenize, batches
+            )
+            next_features = upload(next(tokenized))
+
+            for i in range(len(batches)):
+                features = next_features
+                if self._copy_stream is not None:
+                    compute_stream = torch.cuda.current_stream(self.device)
+                    compute_stream.wait_stream(self._copy_stream)
+                    for value in features.values():
+                        value.record_stream(compute_stream)
+
+                outputs.append(self._model(features)["sentence_embedding"])
+
+                # On CUDA the forward pass is only queued, so the next batch is uploaded in the meantime
+                if i + 1 < len(batches):
+                    next_features = upload(next(tokenized))
+
+        embeddings = torch.nn.functional.normalize(torch.cat(outputs), dim=-1)
+        return embeddings[torch.from_numpy(np.argsort(order)).to(embeddings.device)]
+
+    @torch.inference_mode()
+    def _encode_texts(
+        self, texts: List[str]
+    ) -> Tuple[np.ndarray, np.ndarray, torch.Tensor]:
+        """
+        This method splits the texts into sentences and encodes each unique sentence once.
+        Empty and blank texts have no sentences, so they cost nothing to encode and simply match no entities.
+
+        Args:
+            texts (List[str]): The texts to encode.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, torch.Tensor]: The index of the text of each flattened sentence,
+                the index of the unique sentence of each flattened sentence and the embeddings of the unique sentences.
+        """
+
+        # Split the texts into sentences and then flatten them to perform calculations faster
+        texts = [self._text_to_sentences(text) for text in texts]
+        sentences = list(chain.from_iterable(texts))
+        lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+        sentence_texts = np.repeat(np.arange(len(texts)), lengths)
+
+        # Repeated sentences are encoded and compared only once,
+        # the inverse maps each flattened sentence to its unique one
+        unique_sentences = {s: i for i, s in enumerate(dict.fromkeys(sentences))}
+        inverse = np.fromiter(
+            map(unique_sentences.get, sentences), dtype=np.int64, count=len(sentences)
+        )
+
+        # Calculate the embeddings for all unique sentences
+        sentence_embeddings = self._encode_sentences(list(unique_sentences))
+
+        return sentence_texts, inverse, sentence_embeddings
+
+    @torch.inference_mode()
+    def _match_entities(
         self,
-        texts: List[str],
-        entity_ids: np.ndarray[str],
+        texts_count: int,
+        sentence_texts: np.ndarray,
+        inverse: np.ndarray,
+        sentence_embeddings: torch.Tensor,
+        entity_ids: np.ndarray[bytes],
         entity_embeddings: torch.Tensor,
+        entity_scales: Union[torch.Tensor, None],
         threshold: float,
     ) -> List[List[str]]:
         """
-        This method extracts the entities from the texts.
+        This method matches the encoded sentences of the texts against the entities.
 
         Args:
-            texts (List[str]): The texts from which the entities will be extracted.
-            entity_ids (np.ndarray[str]): The IDs of the entities.
+            texts_count (int): The number of texts the sentences come from.
+            sentence_texts (np.ndarray): The index of the text of each flattened sentence.
+            inverse (np.ndarray): The index of the unique sentence of each flattened sentence.
+            sentence_embeddings (torch.Tensor): The embeddings of the unique sentences.
+            entity_ids (np.ndarray[bytes]): The IDs of the entities as fixed-width bytes.
             entity_embeddings (torch.Tensor): The embeddings of the entities.
+            entity_scales (Union[torch.Tensor, None]): The per-entity scales of the quantized embeddings, None if they are not quantized.
             threshold (float): The similarity threshold for entity comparisons. Increase it to be more harsh.
 
         Returns:
             List[List[str]]: A list of lists containing the IDs of the entities for each text.
         """
 
-        if all(not text for text in texts):
-            return [[] for _ in texts]
-
-        # Split the texts into sentences and then flatten them to perform calculations faster
-        texts = [self._text_to_sentences(text) for text in texts]
-        sentences = list(chain.from_iterable(texts))
+        # Find the most similar entity for each of the unique sentences
+        most_similar_entity_scores, most_similar_entity_indices = self._max_similarity(
+            sentence_embeddings, entity_embeddings, entity_scales
+        )
 
-        # Calculate the embeddings for all flattened sentences
-        sentence_embeddings = self._model.encode(
-            sentences,
-            device=self.device,
-            normalize_embeddings=True,
-            convert_to_tensor=True,
-        )
-
-        # Calculate the similarity between all flattened sentences and all entities and
-        # find the most similar entity for each sentence.
-        # The embeddings are normalized so the dot product is the cosine similarity
-        similarity_matrix = util.dot_score(sentence_embeddings, entity_embeddings)
-        most_similar_entity_scores, most_similar_entity_indices = torch.max(
-            similarity_matrix, dim=-1
-        )
-
-        # Un-flatten the list of most similar entities to match the original texts
-        entity_ids_per_text = []
-        sentences = 0
-
-        for text in texts:
-            sentences_in_text = len(text)
-
-            most_similar_entity_indices_text = most_similar_entity_indices[
-                sentences : sentences + sentences_in_text
-            ]
-            most_similar_entity_scores_text = most_similar_entity_scores[
-                sentences : sentences + sentences_in_text
-            ]
-
-            # Filter the entities based on the threshold
-            most_similar_entity_indices_text = (
-                most_similar_entity_indices_text[
-                    torch.nonzero(most_similar_entity_scores_text > threshold)
-                ]
-                .squeeze(dim=-1)
-                .unique()
-                .tolist()
+        # Mark the sentences below the threshold with -1 on the device, so the results are moved
+        # to the host with a single transfer, then expand them back to the flattened sentences
+        entity_indices = (
+            torch.where(
+                most_similar_entity_scores > threshold, most_similar_entity_indices, -1
             )
+            .cpu()
+            .numpy()[inverse]
+        )
 
-            # Create a list of dictionaries containing the entities for the current text
-            entity_ids_per_text.append(
-                np.take(entity_ids, most_similar_entity_indices_text).tolist()
-            )
+        # Keep only the sentences whose most similar entity passes the threshold and
+        # remember the text each of them came from
+        matches = entity_indices >= 0
+        text_indices = sentence_texts[matches]
+        entity_indices = entity_indices[matches]
 
-            sentences += sentences_in_text
+        # Sort and de-duplicate the (text, entity) pairs at once by combining them into a single key
+        keys = np.unique(text_indices * len(entity_ids) + entity_indices)
+        text_indices, entity_indices = np.divmod(keys, len(entity_ids))
+
+        # Un-flatten the entities to match the original texts
+        bounds = np.searchsorted(text_indices, np.arange(texts_count + 1))
+        matched_ids = entity_ids[entity_indices].astype(str).tolist()
+        entity_ids_per_text = [
+            matched_ids[start:end] for start, end in zip(bounds[:-1], bounds[1:])
+        ]
 
         return entity_ids_per_text
 
+    def _get_entity(
+        self,
+        texts: List[str],
+        entity_ids: np.ndarray[bytes],
+        entity_embeddings: torch.Tensor,
+        entity_scales: Union[torch.Tensor, None],
+        threshold: float,
+    ) -> List[List[str]]:
+        """
+        This method extracts the entities from the texts.
+
+        Args:
+            texts (List[str]): The texts from which the entities will be extracted.
+            entity_ids (np.ndarray[bytes]): The IDs of the entities as fixed-width bytes.
+            entity_embeddings (torch.Tensor): The embeddings of the entities.
+            entity_scales (Union[torch.Tensor, None]): The per-entity scales of the quantized embeddings, None if they are not quantized.
+            threshold (float): The similarity threshold for entity comparisons. Increase it to be more harsh.
+
+        Returns:
+            List[List[str]]: A list of lists containing the IDs of the entities for each text.
+        """
+
+        encoded_texts = self._encode_texts(texts)
+
+        # None of the texts has a sentence (e.g. they are empty or blank), so there is nothing to match
+        if not len(encoded_texts[0]):
+            return [[] for _ in texts]
+
+        return self._match_entities(
+            len(texts),
+            *encoded_texts,
+            entity_ids,
+            entity_embeddings,
+            entity_scales,
+            threshold,
+        )
+
     def get_skills(self, texts: List[str]) -> List[List[str]]:
         """
         This method extracts the ESCO skills from the texts.
@@ -210,6 +734,7 @@ class SkillExtractor:
             texts,
             self._skill_ids,
             self._skill_embeddings,
+            self._skill_scales,
             self.skills_threshold,
         )
 
@@ -225,5 +750,65 @@ class SkillExtractor:
             texts,
             self._occupation_ids,
             self._occupation_embeddings,
+            self._occupation_scales,
             self.occupation_threshold,
         )
+
+    def get_skills_and_occupations(
+        self, texts: List[str]
+    ) -> Tuple[List[List[str]], List[List[str]]]:
+        """
+        This method extracts both the ESCO skills and the ESCO occupations from the texts.
+        The texts are encoded once and matched against both, which is cheaper than calling get_skills and get_occupations.
+
+        Returns:
+            Tuple[List[List[str]], List[List[str]]]: The lists containing the IDs of the skills and of the occupations for each text.
+        """
+
+        encoded_texts = self._encode_texts(texts)
+
+        # None of the texts has a sentence (e.g. they are empty or blank), so there is nothing to match
+        if not len(encoded_texts[0]):
+            return [[] for _ in texts], [[] for _ in texts]
+
+        return (
+            self._match_entities(
+                len(texts),
+                *encoded_texts,
+                self._skill_ids,
+                self._skill_embeddings,
+                self._skill_scales,
+                self.skills_threshold,
+            ),
+            self._match_entities(
+                len(texts),
+                *encoded_texts,
+                self._occupation_ids,
+                self._occupation_embeddings,
+                self._occupation_scales,
+                self.occupation_threshold,
+            ),
+        )
+
+    def warmup(self, batch_size: int = 32):
+        """
+        This method runs the extraction on synthetic texts, at a single sentence and at the given batch size,
+        so the one-time costs (lazy initialization, kernel selection, TensorRT engine building) are paid before serving.
+        The sentences of the synthetic texts are kept out of the sentence cache.
+
+        Args:
+            batch_size (int, optional): The largest number of texts expected in a single call. Defaults to 32.
+        """
+
+        # The texts contain no separators, so each one is encoded as a single sentence
+        short_texts = ["warmup text"]
+        long_texts = [
+            " ".join(["warmup text"] * 100) + f" {i}" for i in range(batch_size)
+        ]
+
+        for texts in (short_texts, long_texts):
+            self.get_skills_and_occupations(texts)
+
+        with self._sentence_cache_lock:
+            for text in short_texts + long_texts:
+                self._sentence_cache.pop(text, None)
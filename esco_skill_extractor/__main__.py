@@ -1,10 +1,25 @@
-from typing import Union
+from contextlib import suppress
+from typing import List, Union
+import importlib.resources
+import mimetypes
 import argparse
+import socket
+import signal
+import os
 
-from flask import Flask, render_template, request, jsonify
-from waitress import serve
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+from fastapi.templating import Jinja2Templates
+import uvicorn
+import orjson
+import jinja2
+import torch
 
 from . import SkillExtractor
+from .batcher import Batcher, BatcherOverloadedError, ShardedBatcher
+from .cache import ResultCache, FingerprintCache
+from .process import ProcessSkillExtractor
 
 
 # ----------- Parse command line arguments -----------
@@ -28,10 +43,17 @@ parser.add_argument(
 parser.add_argument(
     "--device",
     "-d",
-    type=Union[str, None],
+    type=str,
     default=None,
     help="Device to use for computations. Default is cuda if available, else CPU.",
 )
+parser.add_argument(
+    "--precision",
+    "-r",
+    choices=["auto", "fp32", "fp16", "bf16", "int8"],
+    default="auto",
+    help="Precision of the model and the embeddings. Default is int8 on CPU and bf16 (fp16 with TensorRT or on older GPUs) on accelerators",
+)
 parser.add_argument(
     "--host",
     "-c",
@@ -46,53 +68,402 @@ parser.add_argument(
     default=8000,
     help="Port to bind the server to. Default is 8000",
 )
+parser.add_argument(
+    "--workers",
+    "-n",
+    type=int,
+    default=1,
+    help="Number of workers. On CPU these are forked server processes sharing the loaded embeddings (POSIX only), on CUDA inference processes spread over the GPUs. Default is 1",
+)
+parser.add_argument(
+    "--threads",
+    "-t",
+    type=int,
+    default=max(1, (os.cpu_count() or 2) // 2),
+    help="Number of CPU threads used for inference, split between the workers. Default is one per physical core (half the logical cores)",
+)
+parser.add_argument(
+    "--batch_size",
+    type=int,
+    default=32,
+    help="Number of texts after which concurrent requests are processed together without waiting any longer. Default is 32",
+)
+parser.add_argument(
+    "--batch_wait",
+    type=float,
+    default=5,
+    help="Milliseconds to wait for concurrent requests to batch together. Default is 5",
+)
+parser.add_argument(
+    "--queue_size",
+    type=int,
+    default=int(os.environ.get("INFERENCE_MAX_QUEUE", 100)),
+    help="Number of requests that can wait to be processed, further requests get a 503 response. Default is $INFERENCE_MAX_QUEUE or 100",
+)
+parser.add_argument(
+    "--queue_wait",
+    type=float,
+    default=None,
+    help="Milliseconds a request may be estimated to wait for processing (from the recent throughput), longer waits get a 503 response. Default is no limit",
+)
+parser.add_argument(
+    "--inference_process",
+    "-i",
+    action="store_true",
+    help="Run the model in a dedicated process, so inference does not block request handling. Cannot be combined with multiple workers",
+)
+parser.add_argument(
+    "--cache_size",
+    type=int,
+    default=10000,
+    help="Number of texts whose results are cached per endpoint, 0 disables the cache. Default is 10000",
+)
+parser.add_argument(
+    "--fingerprint_distance",
+    type=int,
+    default=None,
+    help="Reuse cached results for near-duplicate texts whose 64-bit fingerprints differ in at most this many bits. Default is exact matches only",
+)
+parser.add_argument(
+    "--max_body_size",
+    type=float,
+    default=32,
+    help="Megabytes a request body may have, larger requests get a 413 response. Default is 32",
+)
+parser.add_argument(
+    "--warmup",
+    "-w",
+    action=argparse.BooleanOptionalAction,
+    default=True,
+    help="Run the model on synthetic texts before serving, so the first requests do not pay the one-time initialization costs. Default is on",
+)
 
 args = parser.parse_args()
+device = args.device or ("cuda" if torch.cuda.is_available() else "cpu")
+
+if args.inference_process and args.workers > 1 and not device.startswith("cuda"):
+    parser.error("--inference_process cannot be combined with multiple CPU --workers")
+
+# On CUDA the workers are the inference processes, which are served by a single server process
+workers = 1 if device.startswith("cuda") else args.workers
+if workers > 1 and (device != "cpu" or not hasattr(os, "fork")):
+    print("Multiple workers are only supported on CUDA and on CPU on POSIX, using 1.")
+    workers = 1
+
+# Keep one intra-op thread per physical core, hyperthreads only contend for the same SIMD units.
+# The OpenMP thread pool does not survive fork(), so a parent that forks workers stays single threaded
+# and never starts it, each worker sets its share of the threads after the fork.
+torch.set_num_threads(args.threads if workers == 1 else 1)
+torch.set_num_interop_threads(1)
 
 # ----------- Initialize the skill extractor -----------
-extractor = SkillExtractor(
+extractor_kwargs = dict(
     skills_threshold=args.skill_threshold,
     occupation_threshold=args.occupation_threshold,
-    device=args.device,
+    device=device,
+    precision=args.precision,
 )
 
-# ----------- Define the Flask app -----------
-BASE_DIR = __file__.replace("__main__.py", "")
-app = Flask(
-    __name__,
-    template_folder=BASE_DIR + "templates",
-    static_folder=BASE_DIR + "static",
+if device.startswith("cuda") and args.workers > 1:
+    # Each worker is an inference process with its own replica, spread round robin over the GPUs unless one is given
+    devices = (
+        [f"cuda:{i}" for i in range(torch.cuda.device_count())]
+        if device == "cuda"
+        else [device]
+    )
+    extractors = [
+        ProcessSkillExtractor(
+            threads=max(1, args.threads // args.workers),
+            **{**extractor_kwargs, "device": devices[i % len(devices)]},
+        )
+        for i in range(args.workers)
+    ]
+elif args.inference_process:
+    extractors = [ProcessSkillExtractor(threads=args.threads, **extractor_kwargs)]
+else:
+    extractors = [SkillExtractor(**extractor_kwargs)]
+
+
+def create_batchers(extractor) -> List[Batcher]:
+    """
+    Creates the batchers of an extractor, which coalesce concurrent requests into a single extractor call.
+    """
+
+    def get_skills_and_occupations(texts):
+        # Return a (skills, occupations) pair per text, so the results can be batched
+        return list(zip(*extractor.get_skills_and_occupations(texts)))
+
+    return [
+        Batcher(
+            function,
+            max_batch_size=args.batch_size,
+            max_wait=args.batch_wait / 1000,
+            max_queue_size=args.queue_size,
+            max_queue_wait=None if args.queue_wait is None else args.queue_wait / 1000,
+        )
+        for function in (
+            extractor.get_skills,
+            extractor.get_occupations,
+            get_skills_and_occupations,
+        )
+    ]
+
+
+# Every extractor has its own queues, the requests go to the one that is estimated to process them first
+skills_batcher, occupations_batcher, skills_and_occupations_batcher = (
+    ShardedBatcher(list(shard_batchers))
+    for shard_batchers in zip(*map(create_batchers, extractors))
+)
+
+# Repeated (or, with a fingerprint distance, near-duplicate) texts are answered from the cache without reaching the batchers
+skills_cache, occupations_cache, skills_and_occupations_cache = (
+    (
+        ResultCache(max_size=args.cache_size)
+        if args.fingerprint_distance is None
+        else FingerprintCache(
+            max_size=args.cache_size, max_distance=args.fingerprint_distance
+        )
+    )
+    for _ in range(3)
+)
+caches = (
+    ("skills", skills_cache),
+    ("occupations", occupations_cache),
+    ("skills_and_occupations", skills_and_occupations_cache),
+)
+batchers = (
+    ("skills", skills_batcher),
+    ("occupations", occupations_batcher),
+    ("skills_and_occupations", skills_and_occupations_batcher),
+)
+
+
+# ----------- Define the FastAPI app -----------
+class ORJSONResponse(JSONResponse):
+    """
+    Serializes the response with orjson, which is several times faster than the standard json module for the nested result lists.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+
+app = FastAPI(title="ESCO Skill Extractor", default_response_class=ORJSONResponse)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    allow_headers=["Content-Type", "X-Requested-With"],
 )
+# The static files and templates are loaded as package resources, so they are found wherever the package is installed,
+# even in a zip archive. The static files are small and read into memory once.
+static_files = {
+    resource.name: resource.read_bytes()
+    for resource in (
+        importlib.resources.files("esco_skill_extractor") / "static"
+    ).iterdir()
+    if resource.is_file()
+}
+# The template is compiled once, it is not checked for changes on every render
+templates = Jinja2Templates(
+    env=jinja2.Environment(
+        loader=jinja2.PackageLoader("esco_skill_extractor", "templates"),
+        autoescape=True,
+        auto_reload=False,
+    )
+)
+
+
+@app.exception_handler(BatcherOverloadedError)
+async def handle_overloaded(request: Request, error: BatcherOverloadedError):
+    return ORJSONResponse({"error": str(error)}, status_code=503)
+
+
+async def read_texts(request: Request) -> List[str]:
+    """
+    Reads the texts of a request from its JSON body, parsed with orjson instead of the standard json module.
+    The body is read up to the maximum size only, so oversized requests are rejected without being buffered.
+    """
+
+    max_size = int(args.max_body_size * 1024 * 1024)
+    if int(request.headers.get("content-length", 0)) > max_size:
+        raise HTTPException(413, "The request body is too large.")
+
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > max_size:
+            raise HTTPException(413, "The request body is too large.")
+
+    try:
+        texts = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        texts = None
+
+    if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+        raise HTTPException(422, "The request body must be a JSON array of strings.")
+
+    return texts
+
 
+@app.get("/", response_class=HTMLResponse)
+async def index(request: Request):
+    return templates.TemplateResponse(
+        request, "index.html", {"host": args.host, "port": args.port}
+    )
 
-@app.after_request
-def handle_options(response):
-    response.headers["Access-Control-Allow-Origin"] = "*"
-    response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS"
-    response.headers["Access-Control-Allow-Headers"] = "Content-Type, X-Requested-With"
-    return response
 
+@app.get("/static/{path:path}", name="static", include_in_schema=False)
+async def static(path: str):
+    if path not in static_files:
+        raise HTTPException(404, "Not Found")
 
-@app.route("/")
-def index():
-    return render_template("index.html", host=args.host, port=args.port)
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    return Response(static_files[path], media_type=media_type)
 
 
-@app.route("/extract-skills", methods=["POST"])
-def extract():
-    return jsonify(extractor.get_skills(request.json))
+# The handlers await the batchers without holding a thread, so waiting requests do not limit concurrency.
+# They return the responses themselves, so the results are serialized by orjson without FastAPI's jsonable_encoder pass.
+@app.post("/extract-skills")
+async def extract_skills(texts: List[str] = Depends(read_texts)):
+    return ORJSONResponse(
+        await skills_cache.call_async(texts, skills_batcher.call_async)
+    )
 
 
-@app.route("/extract-occupations", methods=["POST"])
-def extract_occupations():
-    return jsonify(extractor.get_occupations(request.json))
+@app.post("/extract-occupations")
+async def extract_occupations(texts: List[str] = Depends(read_texts)):
+    return ORJSONResponse(
+        await occupations_cache.call_async(texts, occupations_batcher.call_async)
+    )
 
 
-# 20 minutes timeout, our model might take a while to infer for really big loads
+@app.post("/extract")
+async def extract(texts: List[str] = Depends(read_texts)):
+    results = await skills_and_occupations_cache.call_async(
+        texts, skills_and_occupations_batcher.call_async
+    )
+    return ORJSONResponse(
+        {
+            "skills": [skills for skills, _ in results],
+            "occupations": [occupations for _, occupations in results],
+        }
+    )
+
+
+@app.post("/extract-stream")
+async def extract_stream(texts: List[str] = Depends(read_texts)):
+    async def events():
+        # Each chunk is sent as a server-sent event as soon as it is processed, so large inputs get early results
+        for start in range(0, len(texts), args.batch_size):
+            try:
+                results = await skills_and_occupations_cache.call_async(
+                    texts[start : start + args.batch_size],
+                    skills_and_occupations_batcher.call_async,
+                )
+            except BatcherOverloadedError as error:
+                # The response has already started, so the overload is reported as an event
+                data = orjson.dumps({"error": str(error)})
+                yield b"event: error\ndata: " + data + b"\n\n"
+                return
+
+            data = orjson.dumps(
+                {
+                    "index": start,
+                    "skills": [skills for skills, _ in results],
+                    "occupations": [occupations for _, occupations in results],
+                }
+            )
+            yield b"data: " + data + b"\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def queue_metrics(batcher: Union[Batcher, ShardedBatcher]) -> dict:
+    """
+    Returns the queue metrics of a batcher.
+    """
+
+    return {
+        "depth": batcher.queue_depth,
+        "texts": batcher.queued_texts,
+        "throughput": batcher.throughput,
+        "estimated_wait": batcher.estimated_wait(),
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    return {
+        "cache": {
+            name: {"hits": cache.hits, "misses": cache.misses, "size": len(cache)}
+            for name, cache in caches
+        },
+        "queue": {
+            name: {
+                **queue_metrics(batcher),
+                "shards": [queue_metrics(shard) for shard in batcher.batchers],
+            }
+            for name, batcher in batchers
+        },
+        # Each forked worker reports its own metrics
+        "worker": os.getpid(),
+    }
+
+
+@app.delete("/admin/cache")
+async def flush_cache():
+    # Each worker process has its own caches, so this only flushes the worker serving the request
+    for _, cache in caches:
+        cache.clear()
+    return {"flushed": [name for name, _ in caches]}
+
+
+def serve_workers(workers: int):
+    """
+    Forks the server processes after the extractor is built, so the embeddings are shared copy-on-write.
+    The parent is kept single threaded until then, as torch's OpenMP thread pool would deadlock the workers if it was started before fork().
+    All workers accept connections from the same listening socket, and each has its own batchers and caches.
+
+    Args:
+        workers (int): The number of server processes.
+    """
+
+    sock = socket.create_server((args.host, args.port))
+    children = []
+
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                # Each worker gets its share of the cores and recreates what does not survive fork().
+                # The embeddings (and a PyTorch model's weights) stay shared with the parent.
+                torch.set_num_threads(max(1, args.threads // workers))
+                extractor = extractors[0]
+                extractor._after_fork()
+                if args.warmup:
+                    extractor.warmup(args.batch_size)
+                uvicorn.Server(uvicorn.Config(app)).run(sockets=[sock])
+            finally:
+                os._exit(0)
+        children.append(pid)
+
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        for pid in children:
+            with suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGTERM)
+
+
+# ----------- Start the server -----------
+if workers == 1 and args.warmup:
+    for extractor in extractors:
+        extractor.warmup(args.batch_size)
+
 print(f"Starting the server at http://{args.host}:{args.port}")
-serve(
-    app,
-    host=args.host,
-    port=args.port,
-    channel_timeout=12000,
-)
+if workers > 1:
+    serve_workers(workers)
+else:
+    uvicorn.run(app, host=args.host, port=args.port)
@@ -0,0 +1,294 @@
+from concurrent.futures import Future
+from itertools import chain
+from typing import Callable, List, Tuple, Union
+import threading
+import asyncio
+import queue
+import time
+
+# Multiple of the batch size up to which already queued requests are drained into a batch without waiting
+_DRAIN_FACTOR = 4
+
+
+class BatcherOverloadedError(Exception):
+    """
+    Raised when a request is submitted while the queue of the batcher is full.
+    """
+
+
+class Batcher:
+    def __init__(
+        self,
+        function: Callable[[List[str]], List],
+        max_batch_size: int = 32,
+        max_wait: float = 0.005,
+        max_queue_size: int = 100,
+        max_queue_wait: Union[float, None] = None,
+    ):
+        """
+        Coalesces the texts of concurrent requests into a single call of the given function.
+
+        Args:
+            function (Callable[[List[str]], List]): The function that processes a list of texts and returns one result per text.
+            max_batch_size (int, optional): The number of texts after which a batch is processed without waiting any longer. Defaults to 32.
+            max_wait (float, optional): The seconds to wait for more requests after the first one of a batch arrives. Defaults to 0.005.
+            max_queue_size (int, optional): The number of requests that can wait for a batch, further requests are rejected. Defaults to 100.
+            max_queue_wait (Union[float, None], optional): The seconds a request is estimated to wait at most, requests estimated to wait longer are rejected. Defaults to no limit.
+        """
+
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_queue_wait = max_queue_wait
+        self.queued_texts = 0
+        self.throughput = None
+        self._function = function
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        The number of requests waiting for a batch.
+        """
+
+        return self._queue.qsize()
+
+    def estimated_wait(self, texts_count: int = 0) -> float:
+        """
+        This method estimates the seconds until the waiting texts (and the given number of new ones) are processed,
+        from the recent throughput of the batcher (Little's law).
+
+        Args:
+            texts_count (int, optional): The number of new texts to include. Defaults to 0.
+
+        Returns:
+            float: The estimated wait in seconds, 0 until the throughput is known.
+        """
+
+        if not self.throughput:
+            return 0.0
+
+        return (self.queued_texts + texts_count) / self.throughput
+
+    def submit(self, texts: List[str]) -> Future:
+        """
+        This method queues the texts of a request to be processed with the next batch.
+        The worker thread is started on the first submission, so a batcher created before fork() works in the forked processes.
+        The request is rejected up front if the queue is full or it is estimated to wait longer than the maximum queue wait.
+
+        Args:
+            texts (List[str]): The texts of the request.
+
+        Returns:
+            Future: A future that resolves to the results of the given texts.
+
+        Raises:
+            BatcherOverloadedError: If the queue is full or the estimated wait is too long.
+        """
+
+        future = Future()
+
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+            if (
+                self.max_queue_wait is not None
+                and self.estimated_wait(len(texts)) > self.max_queue_wait
+            ):
+                raise BatcherOverloadedError(
+                    "The requests waiting to be processed would delay this one too long."
+                )
+
+            try:
+                self._queue.put_nowait((texts, future))
+            except queue.Full:
+                raise BatcherOverloadedError(
+                    "Too many requests are waiting to be processed."
+                )
+
+            self.queued_texts += len(texts)
+
+        return future
+
+    async def call_async(self, texts: List[str]) -> List:
+        """
+        This method processes the texts of a request with the next batch, without blocking the event loop while waiting.
+
+        Args:
+            texts (List[str]): The texts of the request.
+
+        Returns:
+            List: The results of the given texts.
+        """
+
+        return await asyncio.wrap_future(self.submit(texts))
+
+    def _next_batch(self) -> List[Tuple[List[str], Future]]:
+        """
+        This method waits for the next request and collects the requests arriving shortly after it.
+        Requests that are already queued are drained without waiting up to a multiple of the batch size,
+        so a backlog is encoded in one call, which sorts all of its sentences by length and pads each encoder batch only to its own longest sentence.
+
+        Returns:
+            List[Tuple[List[str], Future]]: The texts and the futures of the collected requests.
+        """
+
+        items = [self._queue.get()]
+        size = len(items[0][0])
+        deadline = time.monotonic() + self.max_wait
+
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+
+            try:
+                items.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+
+            size += len(items[-1][0])
+
+        while size < self.max_batch_size * _DRAIN_FACTOR:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+            size += len(items[-1][0])
+
+        return items
+
+    def _run(self):
+        """
+        This method processes the batches one after the other and scatters the results back to the requests.
+        Requests cancelled while waiting (e.g. a client that disconnected) are dropped from the batch,
+        and the remaining ones are marked as running, so they cannot be cancelled while their results are set.
+        The throughput is tracked as an exponential moving average of the texts processed per second.
+        """
+
+        while True:
+            items = self._next_batch()
+
+            with self._lock:
+                self.queued_texts -= sum(len(texts) for texts, _ in items)
+
+            items = [
+                (texts, future)
+                for texts, future in items
+                if future.set_running_or_notify_cancel()
+            ]
+            if not items:
+                continue
+
+            texts = list(chain.from_iterable(texts for texts, _ in items))
+
+            # Any failure is handed to the requests of the batch, so the thread keeps serving the next ones
+            try:
+                start = time.monotonic()
+                results = self._function(texts)
+                throughput = len(texts) / max(time.monotonic() - start, 1e-6)
+                self.throughput = (
+                    throughput
+                    if self.throughput is None
+                    else 0.8 * self.throughput + 0.2 * throughput
+                )
+
+                offset = 0
+                for texts, future in items:
+                    future.set_result(results[offset : offset + len(texts)])
+                    offset += len(texts)
+            except Exception as e:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+class ShardedBatcher:
+    def __init__(self, batchers: List[Batcher]):
+        """
+        Spreads the requests over several batchers, each feeding its own extractor (e.g. one per GPU).
+        Every request goes to the batcher that is estimated to process it first, so a stalled shard does not hold up the others.
+
+        Args:
+            batchers (List[Batcher]): The batchers of the shards.
+        """
+
+        self.batchers = batchers
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        The number of requests waiting for a batch in any of the shards.
+        """
+
+        return sum(batcher.queue_depth for batcher in self.batchers)
+
+    @property
+    def queued_texts(self) -> int:
+        """
+        The number of texts waiting for a batch in any of the shards.
+        """
+
+        return sum(batcher.queued_texts for batcher in self.batchers)
+
+    @property
+    def throughput(self) -> Union[float, None]:
+        """
+        The combined throughput of the shards in texts per second, None until it is known.
+        """
+
+        throughputs = [b.throughput for b in self.batchers if b.throughput is not None]
+        return sum(throughputs) if throughputs else None
+
+    def estimated_wait(self, texts_count: int = 0) -> float:
+        """
+        This method estimates the seconds until the given number of new texts would be processed by the least loaded shard.
+
+        Args:
+            texts_count (int, optional): The number of new texts. Defaults to 0.
+
+        Returns:
+            float: The estimated wait in seconds.
+        """
+
+        return min(batcher.estimated_wait(texts_count) for batcher in self.batchers)
+
+    def submit(self, texts: List[str]) -> Future:
+        """
+        This method queues the texts of a request with the shard that is estimated to process them first.
+
+        Args:
+            texts (List[str]): The texts of the request.
+
+        Returns:
+            Future: A future that resolves to the results of the given texts.
+
+        Raises:
+            BatcherOverloadedError: If the chosen shard is overloaded.
+        """
+
+        batcher = min(
+            self.batchers,
+            key=lambda batcher: (
+                batcher.estimated_wait(len(texts)),
+                batcher.queued_texts,
+            ),
+        )
+        return batcher.submit(texts)
+
+    async def call_async(self, texts: List[str]) -> List:
+        """
+        This method processes the texts of a request with the least loaded shard, without blocking the event loop while waiting.
+
+        Args:
+            texts (List[str]): The texts of the request.
+
+        Returns:
+            List: The results of the given texts.
+        """
+
+        return await asyncio.wrap_future(self.submit(texts))
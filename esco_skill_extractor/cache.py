@@ -0,0 +1,225 @@
+from collections import OrderedDict, defaultdict
+from typing import Awaitable, Callable, Hashable, List, Tuple, Union
+import threading
+import hashlib
+import re
+
+import numpy as np
+
+
+class ResultCache:
+    def __init__(self, max_size: int = 10000):
+        """
+        Caches the results of recently processed texts, so repeated texts skip the model entirely.
+        The texts are keyed by a 128-bit BLAKE2b digest, so the cache does not keep the texts themselves in memory.
+
+        Args:
+            max_size (int, optional): The number of results to keep, the least recently used ones are evicted first. Defaults to 10000.
+        """
+
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def call_async(
+        self, texts: List[str], function: Callable[[List[str]], Awaitable[List]]
+    ) -> List:
+        """
+        This method returns the results of the texts, awaiting the function only for the texts that are not cached.
+
+        Args:
+            texts (List[str]): The texts to get the results of.
+            function (Callable[[List[str]], Awaitable[List]]): The coroutine function that processes a list of texts and returns one result per text.
+
+        Returns:
+            List: The results of the texts, in their original order.
+        """
+
+        keys, results, missing = self._lookup(texts)
+        if missing:
+            self._store(
+                keys, results, missing, await function([texts[i] for i in missing])
+            )
+
+        return results
+
+    def _lookup(self, texts: List[str]) -> Tuple[List, List, List[int]]:
+        """
+        This method looks up the cached results of the texts and counts the hits and the misses.
+
+        Args:
+            texts (List[str]): The texts to look up.
+
+        Returns:
+            Tuple[List, List, List[int]]: The keys of the texts, their cached results (None if missing) and the indices of the missing ones.
+        """
+
+        keys = [self._key(text) for text in texts]
+
+        with self._lock:
+            results = [self._get(key) for key in keys]
+            missing = [i for i, result in enumerate(results) if result is None]
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+        return keys, results, missing
+
+    def _store(self, keys: List, results: List, missing: List[int], computed: List):
+        """
+        This method fills in the computed results of the missing texts and caches them.
+
+        Args:
+            keys (List): The keys of the texts.
+            results (List): The results of the texts, filled in place.
+            missing (List[int]): The indices of the texts that were not cached.
+            computed (List): The computed results of the missing texts.
+        """
+
+        with self._lock:
+            for i, result in zip(missing, computed):
+                results[i] = result
+                self._put(keys[i], result)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        """
+        This method removes all the cached results.
+        """
+
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def _key(self, text: str) -> Hashable:
+        """
+        This method computes the cache key of a text.
+
+        Args:
+            text (str): The text to compute the key of.
+
+        Returns:
+            Hashable: The key of the text.
+        """
+
+        return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+    def _get(self, key: Hashable) -> Union[List, None]:
+        """
+        This method looks up the cached result of a key and marks it as recently used. The lock must be held.
+
+        Args:
+            key (Hashable): The key to look up.
+
+        Returns:
+            Union[List, None]: The cached result, None if there is none.
+        """
+
+        if key not in self._entries:
+            return None
+
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def _put(self, key: Hashable, result: List):
+        """
+        This method caches the result of a key. The lock must be held.
+
+        Args:
+            key (Hashable): The key of the result.
+            result (List): The result to cache.
+        """
+
+        self._entries[key] = result
+
+    def _remove(self, key: Hashable):
+        """
+        This method removes the cached result of a key. The lock must be held.
+
+        Args:
+            key (Hashable): The key of the result.
+        """
+
+        del self._entries[key]
+
+
+class FingerprintCache(ResultCache):
+    def __init__(self, max_size: int = 10000, max_distance: int = 3):
+        """
+        Caches the results of recently processed texts, reusing them for near-duplicate texts too.
+        The texts are keyed by a 64-bit SimHash of their lowercased character 3-grams, so texts that differ only
+        in whitespace, casing or a little boilerplate get fingerprints a few bits apart.
+        A text is answered from the cache when a cached fingerprint is within the given Hamming distance,
+        which trades a little accuracy for skipping the model on templated texts.
+
+        Args:
+            max_size (int, optional): The number of results to keep, the least recently used ones are evicted first. Defaults to 10000.
+            max_distance (int, optional): The maximum Hamming distance between the fingerprints of texts sharing a result. Defaults to 3.
+        """
+
+        super().__init__(max_size)
+        self.max_distance = max_distance
+
+        # Fingerprints within the distance share at least one of the distance + 1 bands (pigeonhole principle),
+        # so only the fingerprints sharing a band with the looked up one have to be compared
+        bounds = np.linspace(0, 64, min(max_distance + 1, 64) + 1).astype(int).tolist()
+        self._bands = [
+            ((1 << (end - start)) - 1) << start
+            for start, end in zip(bounds, bounds[1:])
+        ]
+        self._band_index = defaultdict(set)
+
+    def _key(self, text: str) -> int:
+        """
+        This method computes the SimHash fingerprint of a text.
+
+        Args:
+            text (str): The text to compute the fingerprint of.
+
+        Returns:
+            int: The 64-bit fingerprint of the text.
+        """
+
+        text = re.sub(r"\s+", " ", text.strip().lower())
+        shingles = {text[i : i + 3] for i in range(max(1, len(text) - 2))}
+        hashes = np.array(
+            [
+                hashlib.blake2b(shingle.encode(), digest_size=8).digest()
+                for shingle in shingles
+            ],
+            dtype="S8",
+        )
+
+        # Each bit of the fingerprint is set if it is set in the majority of the shingle hashes
+        bits = np.unpackbits(hashes.view(np.uint8)).reshape(len(hashes), 64)
+        majority = bits.sum(axis=0) * 2 > len(hashes)
+        return int.from_bytes(np.packbits(majority).tobytes(), "big")
+
+    def _get(self, key: int) -> Union[List, None]:
+        if key in self._entries:
+            return super()._get(key)
+
+        for band_number, band in enumerate(self._bands):
+            for candidate in self._band_index.get((band_number, key & band), ()):
+                if bin(key ^ candidate).count("1") <= self.max_distance:
+                    return super()._get(candidate)
+
+        return None
+
+    def _put(self, key: int, result: List):
+        super()._put(key, result)
+        for band_number, band in enumerate(self._bands):
+            self._band_index[(band_number, key & band)].add(key)
+
+    def _remove(self, key: int):
+        super()._remove(key)
+        for band_number, band in enumerate(self._bands):
+            index_key = (band_number, key & band)
+            self._band_index[index_key].discard(key)
+            if not self._band_index[index_key]:
+                del self._band_index[index_key]
@@ -0,0 +1,107 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple, Union
+import multiprocessing
+
+import torch
+
+from . import SkillExtractor
+
+# The extractor of the inference process, created by its initializer
+_extractor = None
+
+
+def _initialize(threads: Union[int, None], kwargs: dict):
+    """
+    Creates the extractor once, when the inference process starts.
+    """
+
+    global _extractor
+
+    if threads:
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+
+    _extractor = SkillExtractor(**kwargs)
+
+
+def _device() -> str:
+    """
+    Returns the device of the extractor of the inference process.
+    """
+
+    return _extractor.device
+
+
+def _call(method: str, *args):
+    """
+    Calls a method of the extractor of the inference process.
+    """
+
+    return getattr(_extractor, method)(*args)
+
+
+class ProcessSkillExtractor:
+    def __init__(self, threads: Union[int, None] = None, **kwargs):
+        """
+        Runs a SkillExtractor in a dedicated process and forwards the extraction calls to it.
+        The model inference runs outside of the calling process, so it does not compete with request handling for the GIL.
+        The process is spawned rather than forked, so it can own a CUDA device.
+
+        Args:
+            threads (Union[int, None], optional): The number of intra-op threads of the inference process. Defaults to torch's default.
+            **kwargs: The keyword arguments of SkillExtractor.
+        """
+
+        self._executor = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_initialize,
+            initargs=(threads, kwargs),
+        )
+
+        # Wait for the extractor to be loaded, so failures surface here
+        self.device = self._executor.submit(_device).result()
+
+    def get_skills(self, texts: List[str]) -> List[List[str]]:
+        """
+        This method extracts the ESCO skills from the texts in the inference process.
+
+        Returns:
+            List[List[str]]: A list of lists containing the IDs of the skills for each text.
+        """
+
+        return self._executor.submit(_call, "get_skills", texts).result()
+
+    def get_occupations(self, texts: List[str]) -> List[List[str]]:
+        """
+        This method extracts the ESCO occupations from the texts in the inference process.
+
+        Returns:
+            List[List[str]]: A list of lists containing the IDs of the occupations for each text.
+        """
+
+        return self._executor.submit(_call, "get_occupations", texts).result()
+
+    def get_skills_and_occupations(
+        self, texts: List[str]
+    ) -> Tuple[List[List[str]], List[List[str]]]:
+        """
+        This method extracts both the ESCO skills and the ESCO occupations from the texts in the inference process.
+
+        Returns:
+            Tuple[List[List[str]], List[List[str]]]: The lists containing the IDs of the skills and of the occupations for each text.
+        """
+
+        return self._executor.submit(
+            _call, "get_skills_and_occupations", texts
+        ).result()
+
+    def warmup(self, batch_size: int = 32):
+        """
+        This method warms up the extractor of the inference process, see SkillExtractor.warmup.
+
+        Args:
+            batch_size (int, optional): The largest number of texts expected in a single call. Defaults to 32.
+        """
+
+        self._executor.submit(_call, "warmup", batch_size).result()
@@ -1,17 +1,24 @@
 from setuptools import setup, find_packages
 
+with open("requirements.txt", encoding="utf-8") as f:
+    REQUIREMENTS = [
+        line.strip() for line in f if line.strip() and not line.startswith("#")
+    ]
+
+with open("README.md", encoding="utf-8") as f:
+    README = f.read()
 
 setup(
     name="esco-skill-extractor",
     version="0.1.15",
     packages=find_packages(),
-    install_requires=[r.strip() for r in open("requirements.txt").readlines()],
+    install_requires=REQUIREMENTS,
     include_package_data=True,
     package_data={"esco_skill_extractor": ["data/*.csv"]},
     author="Konstantinos Petrakis",
     author_email="konstpetrakis01@gmail.com",
     description="Extract ESCO skills from texts such as job descriptions or CVs",
-    long_description=open("README.md").read(),
+    long_description=README,
     long_description_content_type="text/markdown",
     url="https://github.com/KonstantinosPetrakis/esco-skill-extractor",
     classifiers=[
@@ -0,0 +1,73 @@
+import threading
+import asyncio
+
+from esco_skill_extractor.batcher import Batcher
+
+
+def _blocking_batcher():
+    """
+    Creates a batcher whose function waits for the returned event, so requests can be queued behind a running batch.
+    """
+
+    release = threading.Event()
+    batches = []
+
+    def function(texts):
+        batches.append(texts)
+        release.wait(timeout=5)
+        return [text.upper() for text in texts]
+
+    return Batcher(function, max_batch_size=32, max_wait=0.01), release, batches
+
+
+def test_cancelled_request_does_not_break_the_batch():
+    batcher, release, batches = _blocking_batcher()
+
+    # The first request keeps the worker thread busy while the others queue up for the next batch
+    first = batcher.submit(["a"])
+    while not batches:
+        pass
+    second, cancelled, third = (batcher.submit([t]) for t in ("b", "c", "d"))
+    assert cancelled.cancel()
+
+    release.set()
+    assert first.result(timeout=5) == ["A"]
+    assert second.result(timeout=5) == ["B"]
+    assert third.result(timeout=5) == ["D"]
+    assert batches[1] == ["b", "d"]
+
+    # The worker thread survives and serves the next requests
+    assert batcher.submit(["e"]).result(timeout=5) == ["E"]
+
+
+def test_cancelled_async_request_does_not_break_the_batch():
+    batcher, release, batches = _blocking_batcher()
+
+    async def main():
+        first = asyncio.ensure_future(batcher.call_async(["a"]))
+        while not batches:
+            await asyncio.sleep(0.001)
+
+        second, cancelled, third = (
+            asyncio.ensure_future(batcher.call_async([t])) for t in ("b", "c", "d")
+        )
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+        await asyncio.sleep(0.01)
+
+        release.set()
+        return await asyncio.wait_for(asyncio.gather(first, second, third), 5)
+
+    assert asyncio.run(main()) == [["A"], ["B"], ["D"]]
+    assert batcher.submit(["e"]).result(timeout=5) == ["E"]
+
+
+def test_function_error_is_set_on_the_requests():
+    def function(texts):
+        raise ValueError("failed")
+
+    batcher = Batcher(function)
+
+    exception = batcher.submit(["a"]).exception(timeout=5)
+    assert isinstance(exception, ValueError)
+    assert isinstance(batcher.submit(["b"]).exception(timeout=5), ValueError)
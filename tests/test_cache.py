@@ -0,0 +1,58 @@
+import asyncio
+
+from esco_skill_extractor.cache import ResultCache, FingerprintCache
+
+
+def _call(cache, texts):
+    """
+    Looks the texts up in the cache, computing the missing ones as their uppercased text.
+    """
+
+    async def function(texts):
+        return [text.upper() for text in texts]
+
+    return asyncio.run(cache.call_async(texts, function))
+
+
+def test_result_cache_hits_and_evicts():
+    cache = ResultCache(max_size=2)
+
+    assert _call(cache, ["a", "b"]) == ["A", "B"]
+    assert _call(cache, ["a", "c"]) == ["A", "C"]
+    assert (cache.hits, cache.misses, len(cache)) == (1, 3, 2)
+
+    # "b" was the least recently used one, so it was evicted
+    assert _call(cache, ["b"]) == ["B"]
+    assert cache.misses == 4
+
+
+def test_fingerprint_cache_hits_near_duplicates():
+    cache = FingerprintCache(max_distance=3)
+    text = "Experienced Python developer with a background in machine learning."
+
+    assert _call(cache, [text]) == [text.upper()]
+    assert _call(cache, [f"  {text.lower()}  "]) == [text.upper()]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    assert _call(cache, ["Certified forklift operator"]) == [
+        "CERTIFIED FORKLIFT OPERATOR"
+    ]
+    assert cache.misses == 2
+
+
+def test_fingerprint_cache_cleans_up_the_band_index():
+    cache = FingerprintCache(max_size=2)
+
+    # Lookups that miss and are never stored (e.g. rejected requests) leave nothing behind
+    for i in range(100):
+        cache._lookup([f"text number {i}"])
+    assert not cache._band_index
+
+    # Evicted and cleared fingerprints are removed from the index
+    _call(cache, ["first text", "second text", "third text"])
+    assert len(cache) == 2
+    assert set().union(*cache._band_index.values()) == set(cache._entries)
+
+    cache.clear()
+    assert len(cache) == 0
+    assert not cache._band_index
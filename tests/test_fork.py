@@ -0,0 +1,146 @@
+import time
+import os
+
+from sentence_transformers import SentenceTransformer, models
+from transformers import BertConfig, BertModel, BertTokenizerFast
+import pytest
+import torch
+
+import esco_skill_extractor
+from esco_skill_extractor import SkillExtractor
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="requires fork()")
+
+
+class _Model:
+    def get_sentence_embedding_dimension(self) -> int:
+        return 384
+
+
+@pytest.fixture
+def extractor(monkeypatch):
+    """
+    Creates an int8 CPU extractor with random entity embeddings instead of the downloaded model.
+    It is built single threaded, as the parent of the forked workers is.
+    """
+
+    def load_models(self):
+        self._model = _Model()
+        self._backend = "torch"
+
+    def create_embeddings(self):
+        sizes = [len(self._skills), len(self._occupations)]
+        embeddings = torch.nn.functional.normalize(torch.randn(sum(sizes), 384), dim=-1)
+        self._skill_embeddings, self._occupation_embeddings = torch.split(
+            embeddings.half(), sizes
+        )
+
+    monkeypatch.setattr(SkillExtractor, "_load_models", load_models)
+    monkeypatch.setattr(SkillExtractor, "_create_embeddings", create_embeddings)
+    monkeypatch.setattr(esco_skill_extractor, "_ENTITIES", {})
+
+    threads = torch.get_num_threads()
+    torch.set_num_threads(1)
+    yield SkillExtractor(device="cpu", precision="int8")
+    torch.set_num_threads(threads)
+
+
+def _run_forked(function, threads: int, timeout: float = 30) -> int:
+    """
+    Runs the function in a forked child with the given number of torch threads.
+
+    Returns:
+        int: The exit code of the child, None if it did not finish in time.
+    """
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            torch.set_num_threads(threads)
+            function()
+            os._exit(0)
+        finally:
+            os._exit(1)
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        finished, status = os.waitpid(pid, os.WNOHANG)
+        if finished:
+            return os.waitstatus_to_exitcode(status)
+        time.sleep(0.05)
+
+    os.kill(pid, 9)
+    os.waitpid(pid, 0)
+    return None
+
+
+def test_forked_worker_matches_with_several_threads(extractor):
+    def match():
+        sentences = torch.nn.functional.normalize(torch.randn(256, 384), dim=-1)
+        scores, indices = extractor._max_similarity(
+            sentences, extractor._skill_embeddings, extractor._skill_scales
+        )
+        assert scores.shape == indices.shape == (256,)
+
+    assert _run_forked(match, threads=2) == 0
+
+
+@pytest.fixture
+def bf16_extractor(monkeypatch, tmp_path):
+    """
+    Creates a bf16 CPU extractor on PyTorch with a small randomly initialized model instead of the downloaded one.
+    It is built single threaded, as the parent of the forked workers is.
+    """
+
+    vocab = tmp_path / "vocab.txt"
+    vocab.write_text(
+        "\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "warmup", "text"])
+    )
+    BertTokenizerFast(vocab_file=str(vocab)).save_pretrained(tmp_path)
+    config = BertConfig(
+        vocab_size=7,
+        hidden_size=384,
+        num_hidden_layers=2,
+        num_attention_heads=6,
+        intermediate_size=1536,
+    )
+    BertModel(config).save_pretrained(tmp_path)
+
+    def sentence_transformer(model_name, device, **kwargs):
+        return SentenceTransformer(
+            modules=[
+                models.Transformer(str(tmp_path)),
+                models.Pooling(384),
+                models.Normalize(),
+            ],
+            device=device,
+        )
+
+    def create_embeddings(self):
+        sizes = [len(self._skills), len(self._occupations)]
+        embeddings = torch.nn.functional.normalize(torch.randn(sum(sizes), 384), dim=-1)
+        self._skill_embeddings, self._occupation_embeddings = torch.split(
+            embeddings.half(), sizes
+        )
+
+    monkeypatch.setattr(
+        esco_skill_extractor, "SentenceTransformer", sentence_transformer
+    )
+    monkeypatch.setattr(SkillExtractor, "_create_embeddings", create_embeddings)
+    monkeypatch.setattr(esco_skill_extractor, "_ENTITIES", {})
+
+    threads = torch.get_num_threads()
+    torch.set_num_threads(1)
+    yield SkillExtractor(device="cpu", precision="bf16")
+    torch.set_num_threads(threads)
+
+
+def test_forked_worker_runs_the_inherited_bf16_model_with_several_threads(
+    bf16_extractor,
+):
+    def warmup():
+        bf16_extractor._after_fork()
+        assert bf16_extractor._model[0].auto_model.dtype == torch.bfloat16
+        bf16_extractor.warmup(batch_size=8)
+
+    assert _run_forked(warmup, threads=2) == 0